@@ -1,21 +1,41 @@
-from fastapi import FastAPI, APIRouter, HTTPException
-from fastapi.responses import StreamingResponse
+from fastapi import FastAPI, APIRouter, HTTPException, Header
+from fastapi.responses import FileResponse, Response, StreamingResponse
 from dotenv import load_dotenv
+from starlette.background import BackgroundTask
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
 import os
 import logging
 from pathlib import Path
-from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, Any
+from pydantic import BaseModel, Field, ValidationError
+from typing import List, Optional, Dict, Any, Tuple
 import uuid
 from datetime import datetime
 import yt_dlp
+from yt_dlp.utils import sanitize_filename
+import uvloop
+import aiohttp
+from cachetools import TTLCache
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
 import tempfile
+import shutil
+import hashlib
+import time
 import asyncio
+import anyio
+import threading
+import weakref
 from concurrent.futures import ThreadPoolExecutor
 import json
 import re
+try:
+    import re2 as url_re
+except ImportError:
+    url_re = re
+import sys
+from urllib.parse import quote
+from operator import itemgetter
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -25,18 +45,70 @@ mongo_url = os.environ['MONGO_URL']
 client = AsyncIOMotorClient(mongo_url)
 db = client[os.environ['DB_NAME']]
 
+# Run on uvloop; serve with `uvicorn server:app --loop uvloop --http httptools --workers $(nproc)`
+uvloop.install()
+
 # Create the main app without a prefix
 app = FastAPI()
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
 
-# Thread pool for yt-dlp operations
-executor = ThreadPoolExecutor(max_workers=3)
+# Size of the loop's default thread pool, which runs the blocking yt-dlp calls
+YDL_THREADS = (os.cpu_count() or 1) * 5
+
+# yt-dlp instances are reused so the extractor and player JS caches survive
+# between requests; YoutubeDL is not thread-safe, so each worker gets its own
+YDL_CACHE_DIR = '/tmp/ytdlp-cache'
+YDL_INFO_OPTS = {
+    'quiet': True,
+    'no_warnings': True,
+    'extract_flat': False,
+    'cachedir': YDL_CACHE_DIR,
+}
+YDL_DL_OPTS = {
+    'quiet': True,
+    'no_warnings': True,
+    'writeinfojson': False,
+    'writethumbnail': False,
+    'cachedir': YDL_CACHE_DIR,
+}
+_ydl_local = threading.local()
+
+# Serialises downloads of the same video and format; entries vanish once no request holds them
+_download_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+# Video info cache: a short-lived in-process L1 in front of a shared Redis L2
+VIDEO_INFO_TTL = 3600
+video_info_cache: TTLCache = TTLCache(maxsize=1024, ttl=60)
+redis_url = os.environ.get('REDIS_URL')
+redis_client = Redis.from_url(redis_url) if redis_url else None
+
+# In-flight extractions by video ID, so concurrent misses share one result
+_inflight: Dict[str, "asyncio.Future[VideoInfo]"] = {}
+
+# Content-addressed download cache, keyed by video ID and format and evicted
+# least-recently-used once it outgrows its size budget. Startup falls back to
+# the system temp dir when this one cannot be created or written
+DOWNLOAD_CACHE_DIR = Path(os.environ.get('DOWNLOAD_CACHE_DIR', '/var/cache/ytdl'))
+DOWNLOAD_CACHE_MAX_BYTES = int(os.environ.get('DOWNLOAD_CACHE_MAX_BYTES', 10 * 1024 ** 3))
+DOWNLOAD_CACHE_SWEEP_INTERVAL = 600
+DOWNLOAD_CACHE_PART_MAX_AGE = 3600
+
+# Read size for streamed downloads; matches the Linux pipe buffer and
+# Starlette's FileResponse chunk size
+STREAM_CHUNK = 64 * 1024
+
+# Native extraction: the watch page embeds the player response as JSON
+YOUTUBE_WATCH_URL = "https://www.youtube.com/watch?v={video_id}"
+PLAYER_RESPONSE_REGEX = re.compile(r'ytInitialPlayerResponse\s*=\s*')
+
+# Longest URL accepted from clients, so validation cost stays bounded
+MAX_URL_LENGTH = 2048
 
 # Define Models
 class VideoInfoRequest(BaseModel):
-    url: str
+    url: str = Field(max_length=MAX_URL_LENGTH)
 
 class VideoFormat(BaseModel):
     format_id: str
@@ -55,25 +127,49 @@ class VideoInfo(BaseModel):
     url: str
 
 class DownloadRequest(BaseModel):
-    url: str
+    url: str = Field(max_length=MAX_URL_LENGTH)
     format_id: str
 
+# Anchored with explicit path prefixes; group 1 is the 11-character video ID,
+# which must end the URL or be followed by a delimiter. RE2 guarantees
+# linear-time matching; the pattern has no nested quantifiers over
+# overlapping input, so stdlib re stays linear as a fallback
+_YT_RE = url_re.compile(
+    r'^(?:https?://)?(?:www\.|m\.)?'
+    r'(?:youtube(?:-nocookie)?\.com/(?:watch\?(?:[^&#]*&)*v=|embed/|v/|shorts/|live/)|youtu\.be/)'
+    r'([A-Za-z0-9_-]{11})(?:$|[?&#/])'
+)
+_YT_PREFIXES = ('http://', 'https://', 'youtu', 'www.', 'm.')
+
+def get_video_id(url: str) -> Optional[str]:
+    """Return the video ID of a YouTube URL, or None if it is not one"""
+    # Cheap prefix test rejects most non-YouTube input before the regex runs
+    if not url.startswith(_YT_PREFIXES):
+        return None
+    match = _YT_RE.match(url)
+    return match.group(1) if match else None
+
 # Helper function to validate YouTube URL
 def is_valid_youtube_url(url: str) -> bool:
     """Validate if the URL is a valid YouTube URL"""
-    youtube_regex = re.compile(
-        r'(https?://)?(www\.)?(youtube|youtu|youtube-nocookie)\.(com|be)/'
-        r'(watch\?v=|embed/|v/|.+\?v=)?([^&=%\?]{11})'
-    )
-    match = youtube_regex.match(url)
-    if not match:
-        return False
-    
-    # Additional validation for YouTube watch URLs
-    if 'youtube.com/watch' in url and 'v=' not in url:
-        return False
-    
-    return True
+    return get_video_id(url) is not None
+
+# Helpers returning this worker thread's long-lived yt-dlp instances. With the
+# yt-dlp[default] extras installed each instance routes HTTP through its
+# Requests handler, whose keep-alive urllib3 pool (TCP_NODELAY on by default)
+# lives as long as the instance, so repeat calls on a worker skip the TCP/TLS
+# handshake
+def get_info_ydl() -> yt_dlp.YoutubeDL:
+    ydl = getattr(_ydl_local, 'info', None)
+    if ydl is None:
+        ydl = _ydl_local.info = yt_dlp.YoutubeDL(YDL_INFO_OPTS)
+    return ydl
+
+def get_download_ydl() -> yt_dlp.YoutubeDL:
+    ydl = getattr(_ydl_local, 'download', None)
+    if ydl is None:
+        ydl = _ydl_local.download = yt_dlp.YoutubeDL(YDL_DL_OPTS)
+    return ydl
 
 # Helper function to extract video info
 def extract_video_info(url: str) -> Dict[str, Any]:
@@ -81,23 +177,16 @@ def extract_video_info(url: str) -> Dict[str, Any]:
     if not is_valid_youtube_url(url):
         raise HTTPException(status_code=400, detail="Invalid YouTube URL format")
     
-    ydl_opts = {
-        'quiet': True,
-        'no_warnings': True,
-        'extract_flat': False,
-    }
-    
     try:
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(url, download=False)
-            if not info:
-                raise HTTPException(status_code=404, detail="Video not found or unavailable")
-            
-            # Check if this is a real video (not a generic response)
-            if info.get('title') == 'InvalidURL' or info.get('uploader') == 'InvalidURL':
-                raise HTTPException(status_code=404, detail="Video not found or unavailable")
-            
-            return info
+        info = get_info_ydl().extract_info(url, download=False)
+        if not info:
+            raise HTTPException(status_code=404, detail="Video not found or unavailable")
+        
+        # Check if this is a real video (not a generic response)
+        if info.get('title') == 'InvalidURL' or info.get('uploader') == 'InvalidURL':
+            raise HTTPException(status_code=404, detail="Video not found or unavailable")
+        
+        return info
     except yt_dlp.utils.DownloadError as e:
         error_msg = str(e)
         if "Video unavailable" in error_msg or "not available" in error_msg:
@@ -111,36 +200,267 @@ def extract_video_info(url: str) -> Dict[str, Any]:
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
 
+def _parse_player_format(fmt: Dict[str, Any]) -> Dict[str, Any]:
+    """Map a streamingData format onto the yt-dlp format fields we use"""
+    mime_type, _, codecs = fmt.get('mimeType', '').partition(';')
+    kind, _, ext = mime_type.strip().partition('/')
+    codec_list = [c.strip() for c in codecs.partition('"')[2].rstrip('"').split(',') if c.strip()]
+
+    if kind == 'audio':
+        vcodec, acodec = 'none', (codec_list[0] if codec_list else None)
+        ext = 'm4a' if ext == 'mp4' else ext
+    else:
+        vcodec = codec_list[0] if codec_list else None
+        acodec = codec_list[1] if len(codec_list) > 1 else 'none'
+
+    content_length = fmt.get('contentLength')
+    return {
+        'format_id': str(fmt['itag']),
+        'ext': ext or 'mp4',
+        'height': fmt.get('height'),
+        'vcodec': vcodec,
+        'acodec': acodec,
+        'filesize': int(content_length) if content_length else None,
+        'format_note': fmt.get('qualityLabel') or fmt.get('quality'),
+    }
+
+# Native coroutine for the common case; returns None when yt-dlp is needed.
+# Formats come from the web client's streamingData alone, while yt-dlp merges
+# several player clients, so the two listings can differ; an itag listed here
+# that yt-dlp will not serve fails its download as "Selected format not available"
+async def extract_video_info_async(url: str, session: aiohttp.ClientSession) -> Optional[Dict[str, Any]]:
+    video_id = get_video_id(url)
+    if video_id is None:
+        raise HTTPException(status_code=400, detail="Invalid YouTube URL format")
+
+    try:
+        async with session.get(YOUTUBE_WATCH_URL.format(video_id=video_id)) as response:
+            if response.status != 200:
+                return None
+            html = await response.text()
+    except (aiohttp.ClientError, asyncio.TimeoutError):
+        return None
+
+    # Consent pages, embeds and layout changes all lack the player response
+    match = PLAYER_RESPONSE_REGEX.search(html)
+    if not match:
+        return None
+    try:
+        player_response, _ = json.JSONDecoder().raw_decode(html, match.end())
+    except ValueError:
+        return None
+
+    # Leave private/unavailable/age-gated videos to yt-dlp's error reporting
+    if player_response.get('playabilityStatus', {}).get('status') != 'OK':
+        return None
+
+    details = player_response.get('videoDetails') or {}
+    streaming_data = player_response.get('streamingData') or {}
+    raw_formats = streaming_data.get('formats', []) + streaming_data.get('adaptiveFormats', [])
+    if not details or not raw_formats:
+        return None
+
+    # Only itags and metadata are returned, so ciphered stream URLs need no
+    # player JS here; the download path deciphers them through yt-dlp
+    thumbnails = details.get('thumbnail', {}).get('thumbnails') or [{}]
+    return {
+        'id': video_id,
+        'title': details.get('title'),
+        'duration': int(details['lengthSeconds']) if details.get('lengthSeconds') else None,
+        'thumbnail': thumbnails[-1].get('url'),
+        'uploader': details.get('author'),
+        'view_count': int(details['viewCount']) if details.get('viewCount') else None,
+        'formats': [_parse_player_format(fmt) for fmt in raw_formats if 'itag' in fmt],
+    }
+
 # Helper function to download video
-def download_video(url: str, format_id: str, output_path: str) -> str:
+def download_video(url: str, format_id: str, output_path: str) -> Tuple[str, str]:
+    """Download a format and return the produced file path and a display filename"""
     # Validate YouTube URL first
     if not is_valid_youtube_url(url):
         raise HTTPException(status_code=400, detail="Invalid YouTube URL format")
     
-    ydl_opts = {
-        'format': format_id,
-        'outtmpl': output_path,
-        'quiet': True,
-        'no_warnings': True,
-    }
-    
     try:
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            ydl.download([url])
-            return output_path
+        ydl = get_download_ydl()
+        # The format selector is compiled from params at construction time,
+        # so rebuild it alongside the per-request params
+        ydl.params['format'] = format_id
+        ydl.params['outtmpl'] = {'default': output_path}
+        ydl.format_selector = ydl.build_format_selector(format_id)
+        info = ydl.extract_info(url, download=True)
+        
+        # Merging can change the extension, so prefer the post-processed path
+        downloads = info.get('requested_downloads') or []
+        file_path = downloads[0].get('filepath') if downloads else None
+        if not file_path:
+            file_path = ydl.prepare_filename(info)
+        
+        filename = ydl.prepare_filename(info, outtmpl='%(title)s') + os.path.splitext(file_path)[1]
+        return file_path, os.path.basename(filename)
     except yt_dlp.utils.DownloadError as e:
-        error_msg = str(e)
-        if "Video unavailable" in error_msg or "not available" in error_msg:
-            raise HTTPException(status_code=404, detail="Video not found or unavailable")
-        elif "Private video" in error_msg:
-            raise HTTPException(status_code=403, detail="Video is private")
-        elif "format not available" in error_msg:
-            raise HTTPException(status_code=400, detail="Selected format not available")
-        else:
-            raise HTTPException(status_code=400, detail=f"Error downloading video: {error_msg}")
+        raise download_error(str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
 
+def download_to_cache(url: str, format_id: str, cache_key: str) -> Tuple[Path, str]:
+    """Download a format into the download cache and return its path and a display filename"""
+    # A private work dir gives yt-dlp names nothing can collide with; it lives
+    # inside the cache dir so the result can be renamed into place
+    temp_dir = tempfile.mkdtemp(prefix='dl-', dir=DOWNLOAD_CACHE_DIR)
+    try:
+        actual_file, filename = download_video(url, format_id, os.path.join(temp_dir, f"{uuid.uuid4().hex}.%(ext)s"))
+        cached_path = DOWNLOAD_CACHE_DIR / f"{cache_key}{os.path.splitext(actual_file)[1]}"
+        os.replace(actual_file, cached_path)
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+    return cached_path, filename
+
+# Helper function to map a yt-dlp download failure onto an HTTP error
+def download_error(error_msg: str) -> HTTPException:
+    # Checked first: yt-dlp's "Requested format is not available" would
+    # otherwise read as an unavailable video
+    if "format is not available" in error_msg or "format not available" in error_msg:
+        return HTTPException(status_code=400, detail="Selected format not available")
+    elif "Video unavailable" in error_msg or "not available" in error_msg:
+        return HTTPException(status_code=404, detail="Video not found or unavailable")
+    elif "Private video" in error_msg:
+        return HTTPException(status_code=403, detail="Video is private")
+    else:
+        return HTTPException(status_code=400, detail=f"Error downloading video: {error_msg}")
+
+# Format selectors offered alongside the per-height formats
+COMMON_FORMATS = (
+    ('best', 'Best available quality'),
+    ('worst', 'Lowest quality'),
+    ('bestvideo+bestaudio', 'Best video + audio'),
+)
+
+SELECTOR_FORMAT_IDS = frozenset(format_id for format_id, _ in COMMON_FORMATS)
+
+# Helper function to build the API response from a yt-dlp style info dict
+def build_video_info(info: Dict[str, Any], url: str) -> VideoInfo:
+    # Extract formats with better filtering, ranked by integer height
+    ranked: List[Tuple[int, VideoFormat]] = []
+    if 'formats' in info:
+        all_formats = info['formats']
+        # First, collect all formats that have both video and audio
+        video_formats = [
+            fmt for fmt in all_formats
+            if fmt.get('vcodec') != 'none' and fmt.get('acodec') != 'none'
+        ]
+        
+        # If no combined formats, try to get best video + audio formats
+        if not video_formats:
+            video_formats = [fmt for fmt in all_formats if fmt.get('vcodec') != 'none']
+        
+        # Sort by quality (height) and keep the first format of each height
+        video_formats.sort(key=lambda x: x.get('height') or 0, reverse=True)
+        first_by_height: Dict[int, Dict[str, Any]] = {}
+        for fmt in video_formats:
+            height = fmt.get('height') or 0
+            if height > 0 and height not in first_by_height:
+                first_by_height[height] = fmt
+        
+        # yt-dlp has already typed these fields, so skip model validation
+        construct = VideoFormat.model_construct
+        ranked = [
+            (height, construct(
+                format_id=fmt['format_id'],
+                ext=fmt.get('ext', 'mp4'),
+                quality=f"{height}p",
+                filesize=fmt.get('filesize'),
+                format_note=fmt.get('format_note')
+            ))
+            for height, fmt in first_by_height.items()
+        ]
+        
+        # Also add common format selectors
+        ranked += [
+            (0, construct(format_id=format_id, ext="mp4", quality=note, filesize=None, format_note=note))
+            for format_id, note in COMMON_FORMATS
+        ]
+    
+    # If still no formats found, add a default format
+    if not ranked:
+        ranked.append((0, VideoFormat(
+            format_id="best",
+            ext="mp4",
+            quality="best",
+            filesize=None,
+            format_note="Best available quality"
+        )))
+    
+    # Sort formats by quality (highest first)
+    ranked.sort(key=itemgetter(0), reverse=True)
+    formats = [video_format for _, video_format in ranked]
+    
+    return VideoInfo(
+        title=info.get('title') or 'Unknown',
+        duration=info.get('duration'),
+        thumbnail=info.get('thumbnail'),
+        uploader=info.get('uploader'),
+        view_count=info.get('view_count'),
+        formats=formats,
+        url=url
+    )
+
+async def get_cached_info(video_id: str) -> Optional[VideoInfo]:
+    video_info = video_info_cache.get(video_id)
+    if video_info is not None or redis_client is None:
+        return video_info
+    
+    try:
+        raw = await redis_client.get(f"ytinfo:{video_id}")
+    except RedisError as e:
+        logger.warning(f"Redis read failed for {video_id}: {e}")
+        return None
+    if raw is None:
+        return None
+    
+    try:
+        video_info = VideoInfo.model_validate_json(raw)
+    except ValidationError as e:
+        # Stale or incompatible entries (e.g. after a model change) are misses
+        logger.warning(f"Discarding unreadable cached info for {video_id}: {e}")
+        return None
+    video_info_cache[video_id] = video_info
+    return video_info
+
+async def set_cached_info(video_id: str, video_info: VideoInfo) -> None:
+    video_info_cache[video_id] = video_info
+    if redis_client is None:
+        return
+    
+    try:
+        await redis_client.setex(f"ytinfo:{video_id}", VIDEO_INFO_TTL, video_info.model_dump_json())
+    except RedisError as e:
+        logger.warning(f"Redis write failed for {video_id}: {e}")
+
+async def _do_extract(url: str, video_id: str) -> VideoInfo:
+    info = await extract_video_info_async(url, app.state.session)
+    if info is None:
+        # Fall back to yt-dlp in thread pool to avoid blocking
+        info = await asyncio.to_thread(extract_video_info, url)
+    
+    video_info = build_video_info(info, url)
+    await set_cached_info(video_id, video_info)
+    return video_info
+
+# Helper function to get video info from the cache or a single shared extraction
+async def resolve_video_info(url: str, video_id: str) -> VideoInfo:
+    video_info = await get_cached_info(video_id)
+    if video_info is not None:
+        return video_info
+    
+    future = _inflight.get(video_id)
+    if future is None:
+        future = asyncio.ensure_future(_do_extract(url, video_id))
+        _inflight[video_id] = future
+        future.add_done_callback(lambda _: _inflight.pop(video_id, None))
+    
+    # A disconnecting caller must not cancel the extraction for the others
+    return await asyncio.shield(future)
+
 @api_router.get("/")
 async def root():
     return {"message": "YouTube Downloader API"}
@@ -149,146 +469,359 @@ async def root():
 async def get_video_info(request: VideoInfoRequest):
     """Get video information including available formats"""
     try:
-        # Run yt-dlp in thread pool to avoid blocking
-        loop = asyncio.get_event_loop()
-        info = await loop.run_in_executor(executor, extract_video_info, request.url)
+        video_id = get_video_id(request.url)
+        if video_id is None:
+            raise HTTPException(status_code=400, detail="Invalid YouTube URL format")
         
-        # Extract formats with better filtering
-        formats = []
-        if 'formats' in info:
-            # First, collect all formats that have both video and audio
-            video_formats = []
-            for fmt in info['formats']:
-                # Include formats that have both video and audio
-                if fmt.get('vcodec') != 'none' and fmt.get('acodec') != 'none':
-                    video_formats.append(fmt)
-            
-            # If no combined formats, try to get best video + audio formats
-            if not video_formats:
-                video_formats = [fmt for fmt in info['formats'] if fmt.get('vcodec') != 'none']
-            
-            # Sort by quality (height) and remove duplicates
-            seen_qualities = set()
-            video_formats.sort(key=lambda x: x.get('height', 0), reverse=True)
-            
-            for fmt in video_formats:
-                height = fmt.get('height')
-                if height and height > 0:
-                    quality_str = f"{height}p"
-                    if quality_str not in seen_qualities:
-                        seen_qualities.add(quality_str)
-                        formats.append(VideoFormat(
-                            format_id=fmt['format_id'],
-                            ext=fmt.get('ext', 'mp4'),
-                            quality=quality_str,
-                            filesize=fmt.get('filesize'),
-                            format_note=fmt.get('format_note')
-                        ))
-            
-            # Also add common format selectors
-            common_formats = [
-                ('best', 'Best available quality'),
-                ('worst', 'Lowest quality'),
-                ('bestvideo+bestaudio', 'Best video + audio'),
-            ]
-            
-            for format_id, note in common_formats:
-                formats.append(VideoFormat(
-                    format_id=format_id,
-                    ext="mp4",
-                    quality=note,
-                    filesize=None,
-                    format_note=note
-                ))
-        
-        # If still no formats found, add a default format
-        if not formats:
-            formats.append(VideoFormat(
-                format_id="best",
-                ext="mp4",
-                quality="best",
-                filesize=None,
-                format_note="Best available quality"
-            ))
+        video_info = await resolve_video_info(request.url, video_id)
         
-        # Sort formats by quality (highest first)
-        formats.sort(key=lambda x: int(x.quality.replace('p', '')) if x.quality.replace('p', '').isdigit() else 0, reverse=True)
-        
-        return VideoInfo(
-            title=info.get('title', 'Unknown'),
-            duration=info.get('duration'),
-            thumbnail=info.get('thumbnail'),
-            uploader=info.get('uploader'),
-            view_count=info.get('view_count'),
-            formats=formats,
-            url=request.url
-        )
+        # Entries are shared by every URL form of the same video. Serialising
+        # in pydantic-core and returning a Response skips FastAPI's outbound
+        # re-validation and jsonable_encoder pass; response_model stays for docs
+        video_info = video_info.model_copy(update={'url': request.url})
+        return Response(content=video_info.model_dump_json(), media_type='application/json')
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
 
-@api_router.post("/download")
-async def download_video_endpoint(request: DownloadRequest):
-    """Download video with specified format"""
+def content_disposition(filename: str) -> str:
+    """Build an attachment header, RFC 5987-encoding non-ASCII names like FileResponse"""
+    quoted = quote(filename)
+    if quoted != filename:
+        return f"attachment; filename*=utf-8''{quoted}"
+    return f'attachment; filename="{filename}"'
+
+def download_cache_key(video_id: str, format_id: str) -> str:
+    return hashlib.sha1(f"{video_id}:{format_id}".encode()).hexdigest()
+
+def download_location(video_id: str, format_id: str) -> str:
+    """GET URL that serves, and resumes, a cached download"""
+    return f"{api_router.prefix}/download/{video_id}/{quote(format_id, safe='')}"
+
+def find_cached_download(cache_key: str) -> Optional[Path]:
+    for path in DOWNLOAD_CACHE_DIR.glob(f"{cache_key}.*"):
+        if path.suffix != '.part':
+            return path
+    return None
+
+async def cached_download_filename(video_id: str, cached_path: Path) -> str:
+    """Name a cache hit after the video title if its info is still cached, else its ID"""
+    video_info = await get_cached_info(video_id)
+    title = video_info.title if video_info is not None else video_id
+    return f"{sanitize_filename(title)}{cached_path.suffix}"
+
+def parse_byte_range(range_header: str, file_size: int) -> Optional[Tuple[int, int]]:
+    """Parse a single 'bytes=' range into inclusive offsets; None serves the whole file"""
+    unit, _, spec = range_header.partition('=')
+    # Multi-range requests may be answered with the full body
+    if unit.strip().lower() != 'bytes' or ',' in spec:
+        return None
+    
+    first, _, last = spec.strip().partition('-')
+    # Checked up front because int() also accepts signs, whitespace and underscores
+    if not (first or last) or not all(part.isascii() and part.isdigit() for part in (first, last) if part):
+        return None
+    
+    if first:
+        start = int(first)
+        end = min(int(last), file_size - 1) if last else file_size - 1
+    else:
+        # Suffix range: the final N bytes
+        start, end = max(file_size - int(last), 0), file_size - 1
+    
+    if start > end or start >= file_size:
+        raise HTTPException(
+            status_code=416,
+            detail="Requested range not satisfiable",
+            headers={'Content-Range': f"bytes */{file_size}"}
+        )
+    return start, end
+
+async def iterrange(path: Path, start: int, length: int):
+    async with await anyio.open_file(path, mode='rb') as file_like:
+        await file_like.seek(start)
+        while length > 0 and (chunk := await file_like.read(min(STREAM_CHUNK, length))):
+            length -= len(chunk)
+            yield chunk
+
+def touch_cached_download(path: Path) -> os.stat_result:
+    # Eviction is least-recently-used by mtime, so refresh it on every serve
+    os.utime(path)
+    return path.stat()
+
+async def cached_download_response(path: Path, filename: str, cache_status: str,
+                                   range_header: Optional[str] = None) -> Response:
+    stat_result = await asyncio.to_thread(touch_cached_download, path)
+    headers = {'Accept-Ranges': 'bytes', 'X-Cache': cache_status}
+    
+    # The pinned Starlette's FileResponse ignores Range, so partial requests
+    # from resuming/segmenting clients are answered here
+    file_size = stat_result.st_size
+    byte_range = parse_byte_range(range_header, file_size) if range_header else None
+    if byte_range is not None:
+        start, end = byte_range
+        headers.update({
+            'Content-Range': f"bytes {start}-{end}/{file_size}",
+            'Content-Length': str(end - start + 1),
+            'Content-Disposition': content_disposition(filename),
+        })
+        return StreamingResponse(
+            iterrange(path, start, end - start + 1),
+            status_code=206,
+            media_type='application/octet-stream',
+            headers=headers
+        )
+    
+    return FileResponse(
+        path,
+        media_type='application/octet-stream',
+        filename=filename,
+        headers=headers,
+        stat_result=stat_result
+    )
+
+def download_dir_usage(path: str) -> Tuple[int, float]:
+    """Return the total size and newest mtime of the files under a directory"""
+    size, newest = 0, 0.0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            try:
+                stat = os.stat(os.path.join(dirpath, name))
+            except FileNotFoundError:
+                continue
+            size += stat.st_size
+            newest = max(newest, stat.st_mtime)
+    return size, newest
+
+def evict_download_cache() -> None:
+    """Delete the least recently used downloads until the cache fits its size budget"""
+    now = time.time()
+    entries = []
+    total_size = 0
+    for entry in os.scandir(DOWNLOAD_CACHE_DIR):
+        if entry.is_dir() and entry.name.startswith('dl-'):
+            # Work dirs of in-progress selector downloads use space but cannot
+            # be evicted; ones left behind by a crash are removed once stale
+            size, newest = download_dir_usage(entry.path)
+            if now - max(newest, entry.stat().st_mtime) > DOWNLOAD_CACHE_PART_MAX_AGE:
+                shutil.rmtree(entry.path, ignore_errors=True)
+            else:
+                total_size += size
+            continue
+        if not entry.is_file():
+            continue
+        stat = entry.stat()
+        if entry.name.endswith('.part'):
+            # Live partial files are written continuously; stale ones were abandoned
+            if now - stat.st_mtime > DOWNLOAD_CACHE_PART_MAX_AGE:
+                try:
+                    os.unlink(entry.path)
+                except FileNotFoundError:
+                    pass
+            continue
+        entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total_size += stat.st_size
+    
+    entries.sort()
+    for _, size, path in entries:
+        if total_size <= DOWNLOAD_CACHE_MAX_BYTES:
+            break
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        total_size -= size
+
+async def sweep_download_cache() -> None:
+    while True:
+        try:
+            await asyncio.to_thread(evict_download_cache)
+        except OSError as e:
+            logger.warning(f"Download cache sweep failed: {e}")
+        await asyncio.sleep(DOWNLOAD_CACHE_SWEEP_INTERVAL)
+
+async def read_tail(stream: asyncio.StreamReader, limit: int = STREAM_CHUNK) -> bytes:
+    """Read a stream to EOF, keeping only its last `limit` bytes"""
+    tail = b''
+    while chunk := await stream.read(limit):
+        tail = (tail + chunk)[-limit:]
+    return tail
+
+# Pipe a single concrete format from a yt-dlp subprocess straight into the
+# response, teeing it into the download cache as it goes
+async def stream_download(url: str, video_info: VideoInfo, video_format: VideoFormat, cache_key: str) -> StreamingResponse:
+    proc = await asyncio.create_subprocess_exec(
+        sys.executable, '-m', 'yt_dlp',
+        '--quiet', '--no-warnings', '--no-progress', '--no-part',
+        '--cache-dir', YDL_CACHE_DIR,
+        '-f', video_format.format_id, '-o', '-', '--', url,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    
+    # Keep stderr drained for the whole run so a noisy yt-dlp cannot block on
+    # a full pipe; the tail holds its final ERROR line
+    stderr_tail = asyncio.ensure_future(read_tail(proc.stderr))
+    
+    async def reap():
+        # Also run before hand-off and as the response's background task: an
+        # unstarted body generator never reaches its own cleanup
+        with anyio.CancelScope(shield=True):
+            if proc.returncode is None:
+                proc.kill()
+                await proc.wait()
+            stderr_tail.cancel()
+    
     try:
-        # Create temporary file
-        temp_dir = tempfile.mkdtemp()
-        output_path = os.path.join(temp_dir, f"%(title)s.%(ext)s")
+        # Wait for the first bytes so extraction failures still map to HTTP errors
+        first_chunk = await proc.stdout.read(STREAM_CHUNK)
+        if not first_chunk:
+            await proc.wait()
+            stderr = await stderr_tail
+            raise download_error(stderr.decode(errors='replace').strip() or "no data received")
+        
+        cache_path = DOWNLOAD_CACHE_DIR / f"{cache_key}.{video_format.ext}"
+        part_path = DOWNLOAD_CACHE_DIR / f"{cache_key}.{uuid.uuid4().hex}.part"
+        
+        async def iterproc():
+            completed = False
+            cache_file = None
+            try:
+                cache_file = await anyio.open_file(part_path, mode='wb')
+                chunk = first_chunk
+                while chunk:
+                    await cache_file.write(chunk)
+                    yield chunk
+                    chunk = await proc.stdout.read(STREAM_CHUNK)
+                if await proc.wait() != 0:
+                    # Abort the response rather than end a truncated body cleanly
+                    stderr = await stderr_tail
+                    raise RuntimeError(
+                        f"yt-dlp exited with status {proc.returncode}: {stderr.decode(errors='replace').strip()}"
+                    )
+                await cache_file.aclose()
+                await asyncio.to_thread(os.replace, part_path, cache_path)
+                completed = True
+            finally:
+                # A client disconnect cancels the stream; cleanup must still finish
+                with anyio.CancelScope(shield=True):
+                    if cache_file is not None:
+                        await cache_file.aclose()
+                    if not completed:
+                        await asyncio.to_thread(part_path.unlink, missing_ok=True)
+                    await reap()
         
-        # Run download in thread pool
-        loop = asyncio.get_event_loop()
-        downloaded_file = await loop.run_in_executor(
-            executor, 
-            download_video, 
-            request.url, 
-            request.format_id, 
-            output_path
+        filename = f"{sanitize_filename(video_info.title)}.{video_format.ext}"
+        headers = {'Content-Disposition': content_disposition(filename), 'X-Cache': 'MISS'}
+        if video_format.filesize:
+            headers['Content-Length'] = str(video_format.filesize)
+        
+        return StreamingResponse(
+            iterproc(),
+            media_type='application/octet-stream',
+            headers=headers,
+            background=BackgroundTask(reap)
         )
+    except BaseException:
+        await reap()
+        raise
+
+@api_router.post("/download")
+async def download_video_endpoint(request: DownloadRequest, range_header: Optional[str] = Header(None, alias="Range")):
+    """Download video with specified format"""
+    try:
+        video_id = get_video_id(request.url)
+        if video_id is None:
+            raise HTTPException(status_code=400, detail="Invalid YouTube URL format")
         
-        # Get the actual filename
-        files = os.listdir(temp_dir)
-        if not files:
-            raise HTTPException(status_code=500, detail="Download failed - no file created")
+        # Entries are only written after their format was validated, so a hit
+        # is served without resolving video info
+        cache_key = download_cache_key(video_id, request.format_id)
+        location = download_location(video_id, request.format_id)
+        cached_path = await asyncio.to_thread(find_cached_download, cache_key)
+        if cached_path is not None:
+            filename = await cached_download_filename(video_id, cached_path)
+            response = await cached_download_response(cached_path, filename, 'HIT', range_header)
+            response.headers['Content-Location'] = location
+            return response
         
-        actual_file = os.path.join(temp_dir, files[0])
+        # Only formats offered by /video-info are accepted, so junk format IDs
+        # are rejected from the info cache before yt-dlp is ever started
+        video_info = await resolve_video_info(request.url, video_id)
+        video_format = next(
+            (fmt for fmt in video_info.formats if fmt.format_id == request.format_id), None
+        )
+        if video_format is None:
+            raise HTTPException(status_code=400, detail="Unknown format_id")
         
-        # Stream the file
-        def iterfile():
-            with open(actual_file, mode="rb") as file_like:
-                yield from file_like
+        # Concrete formats are piped without touching disk; selectors and
+        # merges still need a working file
+        if request.format_id not in SELECTOR_FORMAT_IDS:
+            response = await stream_download(request.url, video_info, video_format, cache_key)
+            response.headers['Content-Location'] = location
+            return response
         
-        # Get file info for headers
-        file_size = os.path.getsize(actual_file)
-        filename = os.path.basename(actual_file)
+        lock = _download_locks.get(cache_key)
+        if lock is None:
+            lock = _download_locks[cache_key] = asyncio.Lock()
         
-        headers = {
-            'Content-Disposition': f'attachment; filename="{filename}"',
-            'Content-Length': str(file_size)
-        }
+        async with lock:
+            # Another request may have filled the cache while this one waited
+            cached_path = await asyncio.to_thread(find_cached_download, cache_key)
+            if cached_path is not None:
+                filename = f"{sanitize_filename(video_info.title)}{cached_path.suffix}"
+                response = await cached_download_response(cached_path, filename, 'HIT', range_header)
+                response.headers['Content-Location'] = location
+                return response
+            
+            # Run download in thread pool
+            cached_path, filename = await asyncio.to_thread(
+                download_to_cache, request.url, request.format_id, cache_key
+            )
         
-        return StreamingResponse(
-            iterfile(),
-            media_type='application/octet-stream',
-            headers=headers
-        )
+        # FileResponse sets Content-Length/Content-Disposition and serves the
+        # file without a Python generator
+        response = await cached_download_response(cached_path, filename, 'MISS', range_header)
+        response.headers['Content-Location'] = location
+        return response
         
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Download error: {str(e)}")
 
-# Include the router in the main app
-app.include_router(api_router)
+@api_router.get("/download/{video_id}/{format_id}")
+async def cached_download_endpoint(video_id: str, format_id: str,
+                                   range_header: Optional[str] = Header(None, alias="Range")):
+    """Serve a cached download, honouring Range so players and download managers can resume"""
+    # Only the cache is consulted; POST /download fills it and returns this
+    # route's URL in Content-Location
+    cached_path = await asyncio.to_thread(find_cached_download, download_cache_key(video_id, format_id))
+    if cached_path is None:
+        raise HTTPException(status_code=404, detail="Download not cached")
+    
+    filename = await cached_download_filename(video_id, cached_path)
+    return await cached_download_response(cached_path, filename, 'HIT', range_header)
 
+# Credentials are only allowed for pinned origins; without FRONTEND_ORIGIN any
+# origin may call the API, but never with cookies. Explicit method/header lists
+# are checked by set membership, and max_age lets browsers cache the preflight
+# for a day instead of repeating it
+frontend_origin = os.environ.get('FRONTEND_ORIGIN')
 app.add_middleware(
     CORSMiddleware,
-    allow_credentials=True,
-    allow_origins=["*"],
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_credentials=frontend_origin is not None,
+    allow_origins=frontend_origin.split(',') if frontend_origin else ["*"],
+    allow_methods=["GET", "POST"],
+    allow_headers=["content-type", "range"],
+    expose_headers=["Content-Disposition", "Content-Range", "Accept-Ranges", "Content-Location"],
+    max_age=86400,
 )
 
+# Include the router in the main app
+app.include_router(api_router)
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -296,6 +829,35 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+def prepare_download_cache_dir() -> Path:
+    """Create the download cache dir, falling back to the system temp dir if it is not writable"""
+    fallback = Path(tempfile.gettempdir()) / 'ytdl-cache'
+    try:
+        DOWNLOAD_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        if os.access(DOWNLOAD_CACHE_DIR, os.W_OK | os.X_OK):
+            return DOWNLOAD_CACHE_DIR
+        logger.warning(f"Download cache dir {DOWNLOAD_CACHE_DIR} is not writable; using {fallback}")
+    except OSError as e:
+        logger.warning(f"Cannot create download cache dir {DOWNLOAD_CACHE_DIR} ({e}); using {fallback}")
+    fallback.mkdir(parents=True, exist_ok=True)
+    return fallback
+
+@app.on_event("startup")
+async def startup_app():
+    global DOWNLOAD_CACHE_DIR
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=YDL_THREADS))
+    DOWNLOAD_CACHE_DIR = await asyncio.to_thread(prepare_download_cache_dir)
+    app.state.cache_sweeper = asyncio.create_task(sweep_download_cache())
+    app.state.session = aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit=100, limit_per_host=8),
+        timeout=aiohttp.ClientTimeout(total=15),
+        headers={'Accept-Language': 'en-US,en;q=0.9'},
+    )
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+    client.close()
+    app.state.cache_sweeper.cancel()
+    await app.state.session.close()
+    if redis_client is not None:
+        await redis_client.aclose()
@@ -94,7 +94,11 @@ class YouTubeDownloaderAPITest(unittest.TestCase):
         
         self.assertEqual(response.status_code, 200)
         self.assertIn('Content-Disposition', response.headers)
-        self.assertIn('Content-Length', response.headers)
+        # Piped downloads fall back to chunked encoding when the size is unknown
+        self.assertTrue(
+            'Content-Length' in response.headers
+            or response.headers.get('Transfer-Encoding') == 'chunked'
+        )
         print("✅ Download endpoint test passed")
 
     def test_06_download_invalid_format(self):
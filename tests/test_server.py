@@ -0,0 +1,452 @@
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+
+# server.py reads its Mongo settings at import time
+os.environ.setdefault('MONGO_URL', 'mongodb://localhost:27017')
+os.environ.setdefault('DB_NAME', 'test_database')
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'backend'))
+
+import yt_dlp  # noqa: E402
+from fastapi import HTTPException  # noqa: E402
+
+import server  # noqa: E402
+
+VALID_URL = "https://www.youtube.com/watch?v=dQw4w9WgXcQ"
+
+VIDEO_ID = "dQw4w9WgXcQ"
+
+
+class GetVideoIdTest(unittest.TestCase):
+    """URL matching shared by /video-info and /download"""
+
+    def test_accepted_urls(self):
+        for url in (
+            f"https://www.youtube.com/watch?v={VIDEO_ID}",
+            f"https://www.youtube.com/watch?feature=share&v={VIDEO_ID}&t=10",
+            f"https://www.youtube.com/watch?v={VIDEO_ID}#t=5",
+            f"youtube.com/watch?v={VIDEO_ID}",
+            f"https://m.youtube.com/watch?v={VIDEO_ID}",
+            f"https://youtu.be/{VIDEO_ID}",
+            f"https://youtu.be/{VIDEO_ID}?si=abc",
+            f"https://www.youtube.com/shorts/{VIDEO_ID}",
+            f"https://www.youtube.com/embed/{VIDEO_ID}",
+            f"https://www.youtube-nocookie.com/embed/{VIDEO_ID}",
+            f"https://www.youtube.com/v/{VIDEO_ID}",
+            f"https://www.youtube.com/live/{VIDEO_ID}?feature=share",
+        ):
+            with self.subTest(url=url):
+                self.assertEqual(server.get_video_id(url), VIDEO_ID)
+                self.assertTrue(server.is_valid_youtube_url(url))
+
+    def test_rejected_urls(self):
+        for url in (
+            "https://www.example.com",
+            f"https://evil.com/youtube.com/watch?v={VIDEO_ID}",
+            f"https://youtube.com.evil.com/watch?v={VIDEO_ID}",
+            "https://www.youtube.com/invalid_url",
+            "https://www.youtube.com/watch?x=1",
+            f"https://www.youtube.com/channel/{VIDEO_ID}",
+            f"ftp://youtube.com/watch?v={VIDEO_ID}",
+        ):
+            with self.subTest(url=url):
+                self.assertIsNone(server.get_video_id(url))
+                self.assertFalse(server.is_valid_youtube_url(url))
+
+    def test_rejects_ids_longer_than_eleven_characters(self):
+        self.assertIsNone(server.get_video_id(f"https://youtu.be/{VIDEO_ID}XYZ"))
+        self.assertIsNone(server.get_video_id(f"https://www.youtube.com/watch?v={VIDEO_ID}X"))
+
+
+class YtDlpHelpersTest(unittest.TestCase):
+    """Exercise the thread-pool yt-dlp helpers against a stubbed YoutubeDL"""
+
+    def setUp(self):
+        # Fresh per-thread storage so each test builds its own stub instance
+        local_patch = mock.patch.object(server, '_ydl_local', threading.local())
+        local_patch.start()
+        self.addCleanup(local_patch.stop)
+
+        ydl_patch = mock.patch.object(server.yt_dlp, 'YoutubeDL')
+        self.YoutubeDL = ydl_patch.start()
+        self.addCleanup(ydl_patch.stop)
+        self.ydl = self.YoutubeDL.return_value
+        self.ydl.params = {}
+
+    def test_extract_video_info_returns_info(self):
+        self.ydl.extract_info.return_value = {'title': 'Never Gonna Give You Up', 'formats': []}
+
+        info = server.extract_video_info(VALID_URL)
+
+        self.assertEqual(info['title'], 'Never Gonna Give You Up')
+        self.ydl.extract_info.assert_called_once_with(VALID_URL, download=False)
+        self.YoutubeDL.assert_called_once_with(server.YDL_INFO_OPTS)
+
+    def test_extract_video_info_reuses_instance(self):
+        self.ydl.extract_info.return_value = {'title': 'Video'}
+
+        server.extract_video_info(VALID_URL)
+        server.extract_video_info(VALID_URL)
+
+        self.assertEqual(self.YoutubeDL.call_count, 1)
+
+    def test_extract_video_info_maps_private_video(self):
+        self.ydl.extract_info.side_effect = yt_dlp.utils.DownloadError("ERROR: Private video")
+
+        with self.assertRaises(HTTPException) as ctx:
+            server.extract_video_info(VALID_URL)
+        self.assertEqual(ctx.exception.status_code, 403)
+
+    def test_extract_video_info_rejects_invalid_url(self):
+        with self.assertRaises(HTTPException) as ctx:
+            server.extract_video_info("https://www.example.com")
+        self.assertEqual(ctx.exception.status_code, 400)
+        self.YoutubeDL.assert_not_called()
+
+    def test_download_video_returns_path_and_filename(self):
+        self.ydl.extract_info.return_value = {
+            'title': 'Video',
+            'requested_downloads': [{'filepath': '/tmp/dl/abc.mkv'}],
+        }
+        self.ydl.prepare_filename.return_value = 'Video'
+
+        file_path, filename = server.download_video(VALID_URL, 'bestvideo+bestaudio', '/tmp/dl/abc.%(ext)s')
+
+        self.assertEqual(file_path, '/tmp/dl/abc.mkv')
+        self.assertEqual(filename, 'Video.mkv')
+        self.assertEqual(self.ydl.params['format'], 'bestvideo+bestaudio')
+        self.assertEqual(self.ydl.params['outtmpl'], {'default': '/tmp/dl/abc.%(ext)s'})
+        self.ydl.build_format_selector.assert_called_once_with('bestvideo+bestaudio')
+        self.ydl.extract_info.assert_called_once_with(VALID_URL, download=True)
+
+    def test_download_video_maps_download_error(self):
+        self.ydl.extract_info.side_effect = yt_dlp.utils.DownloadError("ERROR: Video unavailable")
+
+        with self.assertRaises(HTTPException) as ctx:
+            server.download_video(VALID_URL, 'best', '/tmp/dl/abc.%(ext)s')
+        self.assertEqual(ctx.exception.status_code, 404)
+
+
+class FakeResponse:
+    def __init__(self, status, text):
+        self.status = status
+        self._text = text
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    async def text(self):
+        return self._text
+
+
+class FakeSession:
+    def __init__(self, status=200, text=''):
+        self.response = FakeResponse(status, text)
+        self.urls = []
+
+    def get(self, url):
+        self.urls.append(url)
+        return self.response
+
+
+def watch_page(player_response):
+    return f"<script>var ytInitialPlayerResponse = {json.dumps(player_response)};var meta = {{}};</script>"
+
+
+PLAYER_RESPONSE = {
+    'playabilityStatus': {'status': 'OK'},
+    'videoDetails': {
+        'title': 'Never Gonna Give You Up',
+        'lengthSeconds': '212',
+        'author': 'Rick Astley',
+        'viewCount': '1500000000',
+        'thumbnail': {'thumbnails': [{'url': 'https://i.ytimg.com/small.jpg'}, {'url': 'https://i.ytimg.com/large.jpg'}]},
+    },
+    'streamingData': {
+        'formats': [
+            {'itag': 18, 'mimeType': 'video/mp4; codecs="avc1.42001E, mp4a.40.2"', 'height': 360, 'qualityLabel': '360p'},
+        ],
+        'adaptiveFormats': [
+            {'itag': 137, 'mimeType': 'video/mp4; codecs="avc1.640028"', 'height': 1080,
+             'qualityLabel': '1080p', 'contentLength': '123456'},
+            {'itag': 140, 'mimeType': 'audio/mp4; codecs="mp4a.40.2"', 'quality': 'tiny'},
+        ],
+    },
+}
+
+
+class ParsePlayerFormatTest(unittest.TestCase):
+    """Mapping of web-client streamingData formats onto yt-dlp's fields"""
+
+    def test_muxed_format(self):
+        fmt = server._parse_player_format(PLAYER_RESPONSE['streamingData']['formats'][0])
+
+        self.assertEqual(fmt['format_id'], '18')
+        self.assertEqual(fmt['ext'], 'mp4')
+        self.assertEqual(fmt['height'], 360)
+        self.assertEqual(fmt['vcodec'], 'avc1.42001E')
+        self.assertEqual(fmt['acodec'], 'mp4a.40.2')
+        self.assertIsNone(fmt['filesize'])
+        self.assertEqual(fmt['format_note'], '360p')
+
+    def test_video_only_format(self):
+        fmt = server._parse_player_format(PLAYER_RESPONSE['streamingData']['adaptiveFormats'][0])
+
+        self.assertEqual(fmt['vcodec'], 'avc1.640028')
+        self.assertEqual(fmt['acodec'], 'none')
+        self.assertEqual(fmt['filesize'], 123456)
+
+    def test_audio_only_mp4_is_m4a(self):
+        fmt = server._parse_player_format(PLAYER_RESPONSE['streamingData']['adaptiveFormats'][1])
+
+        self.assertEqual(fmt['ext'], 'm4a')
+        self.assertEqual(fmt['vcodec'], 'none')
+        self.assertEqual(fmt['acodec'], 'mp4a.40.2')
+        self.assertEqual(fmt['format_note'], 'tiny')
+
+    def test_audio_only_webm_keeps_ext(self):
+        fmt = server._parse_player_format({'itag': 251, 'mimeType': 'audio/webm; codecs="opus"'})
+
+        self.assertEqual(fmt['ext'], 'webm')
+        self.assertEqual(fmt['acodec'], 'opus')
+
+
+class ExtractVideoInfoAsyncTest(unittest.IsolatedAsyncioTestCase):
+    """Native watch-page extraction and the cases that fall back to yt-dlp"""
+
+    async def extract(self, status=200, text=''):
+        return await server.extract_video_info_async(VALID_URL, FakeSession(status, text))
+
+    async def test_extracts_details_and_formats(self):
+        info = await self.extract(text=watch_page(PLAYER_RESPONSE))
+
+        self.assertEqual(info['id'], VIDEO_ID)
+        self.assertEqual(info['title'], 'Never Gonna Give You Up')
+        self.assertEqual(info['duration'], 212)
+        self.assertEqual(info['thumbnail'], 'https://i.ytimg.com/large.jpg')
+        self.assertEqual(info['view_count'], 1500000000)
+        self.assertEqual([fmt['format_id'] for fmt in info['formats']], ['18', '137', '140'])
+
+    async def test_missing_title_defaults_to_unknown(self):
+        player_response = json.loads(json.dumps(PLAYER_RESPONSE))
+        del player_response['videoDetails']['title']
+
+        info = await self.extract(text=watch_page(player_response))
+
+        self.assertEqual(server.build_video_info(info, VALID_URL).title, 'Unknown')
+
+    async def test_non_ok_playability_falls_back(self):
+        player_response = dict(PLAYER_RESPONSE, playabilityStatus={'status': 'LOGIN_REQUIRED'})
+        self.assertIsNone(await self.extract(text=watch_page(player_response)))
+
+    async def test_missing_player_response_falls_back(self):
+        self.assertIsNone(await self.extract(text='<html>consent</html>'))
+
+    async def test_truncated_player_response_falls_back(self):
+        self.assertIsNone(await self.extract(text='var ytInitialPlayerResponse = {"playabilityStatus": '))
+
+    async def test_missing_formats_falls_back(self):
+        player_response = dict(PLAYER_RESPONSE, streamingData={})
+        self.assertIsNone(await self.extract(text=watch_page(player_response)))
+
+    async def test_http_error_falls_back(self):
+        self.assertIsNone(await self.extract(status=429))
+
+    async def test_invalid_url_is_rejected(self):
+        with self.assertRaises(HTTPException) as ctx:
+            await server.extract_video_info_async("https://www.example.com", FakeSession())
+        self.assertEqual(ctx.exception.status_code, 400)
+
+
+class DownloadErrorTest(unittest.TestCase):
+    def test_unavailable_format_is_not_reported_as_missing_video(self):
+        error = server.download_error(
+            "ERROR: [youtube] dQw4w9WgXcQ: Requested format is not available. Use --list-formats"
+        )
+        self.assertEqual(error.status_code, 400)
+        self.assertEqual(error.detail, "Selected format not available")
+
+    def test_unavailable_video(self):
+        self.assertEqual(server.download_error("ERROR: Video unavailable").status_code, 404)
+
+
+class ParseByteRangeTest(unittest.TestCase):
+    """Single-range parsing for cached download responses"""
+
+    def assert_unsatisfiable(self, range_header, file_size=1000):
+        with self.assertRaises(HTTPException) as ctx:
+            server.parse_byte_range(range_header, file_size)
+        self.assertEqual(ctx.exception.status_code, 416)
+        self.assertEqual(ctx.exception.headers['Content-Range'], f"bytes */{file_size}")
+
+    def test_closed_range(self):
+        self.assertEqual(server.parse_byte_range("bytes=0-99", 1000), (0, 99))
+
+    def test_open_ended_range(self):
+        self.assertEqual(server.parse_byte_range("bytes=100-", 1000), (100, 999))
+
+    def test_end_is_clamped_to_file_size(self):
+        self.assertEqual(server.parse_byte_range("bytes=900-5000", 1000), (900, 999))
+
+    def test_suffix_range(self):
+        self.assertEqual(server.parse_byte_range("bytes=-50", 1000), (950, 999))
+
+    def test_suffix_longer_than_file(self):
+        self.assertEqual(server.parse_byte_range("bytes=-5000", 1000), (0, 999))
+
+    def test_empty_suffix_is_unsatisfiable(self):
+        self.assert_unsatisfiable("bytes=-0")
+
+    def test_start_past_eof_is_unsatisfiable(self):
+        self.assert_unsatisfiable("bytes=1000-")
+        self.assert_unsatisfiable("bytes=2000-3000")
+
+    def test_reversed_range_is_unsatisfiable(self):
+        self.assert_unsatisfiable("bytes=500-100")
+
+    def test_multi_range_serves_full_body(self):
+        self.assertIsNone(server.parse_byte_range("bytes=0-1,5-6", 1000))
+
+    def test_malformed_input_serves_full_body(self):
+        for range_header in ("bytes=a-b", "bytes=", "bytes=-", "items=0-1", "0-99"):
+            with self.subTest(range_header=range_header):
+                self.assertIsNone(server.parse_byte_range(range_header, 1000))
+
+    def test_signed_and_non_digit_offsets_serve_full_body(self):
+        for range_header in ("bytes=--5", "bytes=5--1", "bytes=+5-10", "bytes=0-+9",
+                             "bytes=1_0-20", "bytes=5- 10", "bytes=٣-9"):
+            with self.subTest(range_header=range_header):
+                self.assertIsNone(server.parse_byte_range(range_header, 1000))
+
+
+class CachedDownloadEndpointTest(unittest.IsolatedAsyncioTestCase):
+    """Serving cached downloads over GET, and POST pointing clients at it"""
+
+    def setUp(self):
+        self.cache_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.cache_dir, ignore_errors=True)
+        for name, value in (('DOWNLOAD_CACHE_DIR', self.cache_dir), ('redis_client', None)):
+            patcher = mock.patch.object(server, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        server.video_info_cache.clear()
+        self.addCleanup(server.video_info_cache.clear)
+
+    def cache_download(self, format_id, content=b'0123456789'):
+        path = self.cache_dir / f"{server.download_cache_key(VIDEO_ID, format_id)}.mp4"
+        path.write_bytes(content)
+        return path
+
+    async def test_serves_range_from_cache(self):
+        self.cache_download('18')
+
+        response = await server.cached_download_endpoint(VIDEO_ID, '18', range_header='bytes=2-5')
+
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.headers['Content-Range'], 'bytes 2-5/10')
+        self.assertEqual(response.headers['Content-Length'], '4')
+        self.assertIn(f'filename="{VIDEO_ID}.mp4"', response.headers['Content-Disposition'])
+
+    async def test_serves_full_file_without_range(self):
+        self.cache_download('bestvideo+bestaudio')
+
+        response = await server.cached_download_endpoint(VIDEO_ID, 'bestvideo+bestaudio', range_header=None)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['Content-Length'], '10')
+        self.assertEqual(response.headers['X-Cache'], 'HIT')
+
+    async def test_uncached_download_is_not_found(self):
+        with self.assertRaises(HTTPException) as ctx:
+            await server.cached_download_endpoint(VIDEO_ID, '18', range_header=None)
+        self.assertEqual(ctx.exception.status_code, 404)
+
+    async def test_post_hit_points_at_get_route(self):
+        self.cache_download('bestvideo+bestaudio')
+
+        response = await server.download_video_endpoint(
+            server.DownloadRequest(url=VALID_URL, format_id='bestvideo+bestaudio'), range_header=None
+        )
+
+        self.assertEqual(response.headers['X-Cache'], 'HIT')
+        self.assertEqual(
+            response.headers['Content-Location'], f"/api/download/{VIDEO_ID}/bestvideo%2Bbestaudio"
+        )
+
+
+class DownloadCacheTest(unittest.TestCase):
+    """Cache dir setup and the periodic eviction sweep"""
+
+    def setUp(self):
+        self.cache_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.cache_dir, ignore_errors=True)
+        dir_patch = mock.patch.object(server, 'DOWNLOAD_CACHE_DIR', self.cache_dir)
+        dir_patch.start()
+        self.addCleanup(dir_patch.stop)
+
+    def make_file(self, path, size, age=0):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b'x' * size)
+        mtime = time.time() - age
+        os.utime(path, (mtime, mtime))
+        return path
+
+    def test_unusable_cache_dir_falls_back_to_temp_dir(self):
+        blocker = self.make_file(self.cache_dir / 'blocker', 1)
+        fallback_root = self.cache_dir / 'tmp'
+        fallback_root.mkdir()
+
+        with mock.patch.object(server, 'DOWNLOAD_CACHE_DIR', blocker / 'ytdl'), \
+                mock.patch.object(server.tempfile, 'gettempdir', return_value=str(fallback_root)):
+            cache_dir = server.prepare_download_cache_dir()
+
+        self.assertEqual(cache_dir, fallback_root / 'ytdl-cache')
+        self.assertTrue(cache_dir.is_dir())
+
+    def test_evicts_least_recently_used_over_budget(self):
+        old = self.make_file(self.cache_dir / 'old.mp4', 60, age=100)
+        new = self.make_file(self.cache_dir / 'new.mp4', 60)
+
+        with mock.patch.object(server, 'DOWNLOAD_CACHE_MAX_BYTES', 100):
+            server.evict_download_cache()
+
+        self.assertFalse(old.exists())
+        self.assertTrue(new.exists())
+
+    def test_live_work_dirs_count_toward_budget(self):
+        entry = self.make_file(self.cache_dir / 'entry.mp4', 60)
+        self.make_file(self.cache_dir / 'dl-live' / 'video.f137.mp4', 60)
+
+        with mock.patch.object(server, 'DOWNLOAD_CACHE_MAX_BYTES', 100):
+            server.evict_download_cache()
+
+        self.assertFalse(entry.exists())
+        self.assertTrue((self.cache_dir / 'dl-live').exists())
+
+    def test_stale_work_dirs_and_parts_are_removed(self):
+        stale_age = server.DOWNLOAD_CACHE_PART_MAX_AGE + 60
+        work_dir = self.cache_dir / 'dl-stale'
+        self.make_file(work_dir / 'video.f137.mp4', 10, age=stale_age)
+        os.utime(work_dir, (time.time() - stale_age,) * 2)
+        stale_part = self.make_file(self.cache_dir / 'key.abc.part', 10, age=stale_age)
+        live_part = self.make_file(self.cache_dir / 'key.def.part', 10)
+
+        server.evict_download_cache()
+
+        self.assertFalse(work_dir.exists())
+        self.assertFalse(stale_part.exists())
+        self.assertTrue(live_part.exists())
+
+
+if __name__ == "__main__":
+    unittest.main()